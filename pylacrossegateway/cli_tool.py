@@ -16,66 +16,61 @@
 # USA
 
 import argparse
-import codecs
 import logging
 import os
-import time
-try:
-    from ConfigParser import (ConfigParser, NoOptionError)
-except ImportError:
-    from configparser import (ConfigParser, NoOptionError)
+import sys
+from configparser import ConfigParser
 
 import pylacrossegateway
 
 _LOGGER = logging.getLogger(__name__)
 
-def get_known_sensor_name(sensor_id, config):
-    try:
-        if str(sensor_id) in config.sections():
-            name = config.get(str(sensor_id), 'name')
-            return name
-    except NoOptionError as e:
-        return 'unknown'
-    except AttributeError:
-        return 'unknown'
-    return 'unknown'
+def get_known_sensor_name(sensor_id, known):
+    return known.get(str(sensor_id), 'unknown')
 
 
-def scan_callback(sensor, config):
-    name = get_known_sensor_name(sensor.sensorid, config)
-    print('%s name=%s' % (sensor, name))
+def scan_callback(sensor, known):
+    name = get_known_sensor_name(sensor.sensorid, known)
+    sys.stdout.write('%s name=%s\n' % (sensor, name))
 
 
-def configure(lacrossegateway, config, args):
+def configure(lacrossegateway, known, args):
+    cmds = []
     if args.frequency_rfm1:
-        lacrossegateway.set_frequency(args.frequency_rfm1, 1)
+        cmds.append(lacrossegateway.frequency_cmd(args.frequency_rfm1, 1))
     if args.frequency_rfm2:
-        lacrossegateway.set_frequency(args.frequency_rfm2, 2)
+        cmds.append(lacrossegateway.frequency_cmd(args.frequency_rfm2, 2))
 
     if args.datarate_rfm1:
-        lacrossegateway.set_datarate(args.datarate_rfm1, 1)
+        cmds.append(lacrossegateway.datarate_cmd(args.datarate_rfm1, 1))
     if args.datarate_rfm2:
-        lacrossegateway.set_datarate(args.datarate_rfm1, 2)
+        cmds.append(lacrossegateway.datarate_cmd(args.datarate_rfm2, 2))
 
     if args.toggle_mask_rfm1:
-        lacrossegateway.set_toggle_mask(args.toggle_mask_rfm1, 1)
+        cmds.append(lacrossegateway.toggle_mask_cmd(args.toggle_mask_rfm1, 1))
     if args.toggle_mask_rfm2:
-        lacrossegateway.set_toggle_mask(args.toggle_mask_rfm2, 2)
+        cmds.append(lacrossegateway.toggle_mask_cmd(args.toggle_mask_rfm2, 2))
 
     if args.toggle_interval_rfm1:
-        lacrossegateway.set_toggle_interval(args.toggle_interval_rfm1, 1)
+        cmds.append(lacrossegateway.toggle_interval_cmd(
+            args.toggle_interval_rfm1, 1))
     if args.toggle_interval_rfm2:
-        lacrossegateway.set_toggle_interval(args.toggle_interval_rfm1, 2)
+        cmds.append(lacrossegateway.toggle_interval_cmd(
+            args.toggle_interval_rfm2, 2))
+
+    lacrossegateway.write_cmds(cmds)
 
 
-def scan(lacrossegateway, config, args):
-    lacrossegateway.register_all(scan_callback, user_data=config)
+def scan(lacrossegateway, known, args):
+    lacrossegateway.register_all(scan_callback, user_data=known)
     lacrossegateway.start_scan()
-    while True:
-        time.sleep(1)
+    lacrossegateway.wait()
 
-def get_info(lacrossegateway, config, args):
-    info = lacrossegateway.get_info()
+def get_info(lacrossegateway, known, args):
+    try:
+        info = lacrossegateway.get_info()
+    except (TimeoutError, ConnectionError) as e:
+        sys.exit('error: {}'.format(e))
     print('name:     {}'.format(info['name']))
     print('version:  {}'.format(info['version']))
     if 'rfm1name' in info:
@@ -85,7 +80,7 @@ def get_info(lacrossegateway, config, args):
         print('rfm1toggleinterval: {}'.format(info['rfm1toggleinterval']))
         print('rfm1togglemask: {}'.format(info['rfm1togglemask']))
 
-def led(lacrossegateway, config, args):
+def led(lacrossegateway, known, args):
     state = args.led_state.lower() == 'on'
     lacrossegateway.led_config(state)
 
@@ -139,24 +134,24 @@ def main(args=None):
     if args.verbose:
         _LOGGER.setLevel(logging.DEBUG)
 
-    try:
-        config = ConfigParser()
-        config.readfp(codecs.open(os.path.expanduser(
-                '~/.lacrossegateway/known_sensors.ini'), 'r', 'UTF-8'))
-    except IOError:
-        config = None
+    config = ConfigParser()
+    config.read(os.path.expanduser('~/.lacrossegateway/known_sensors.ini'),
+                encoding='utf-8')
+
+    known = {section: config.get(section, 'name', fallback='unknown')
+             for section in config.sections()}
 
     lacrossegateway = None
     try:
         lacrossegateway = pylacrossegateway.LaCrosseGateway(args.host, args.port)
         lacrossegateway.open()
-        configure(lacrossegateway, config, args)
+        configure(lacrossegateway, known, args)
         try:
             func = args.func
         except AttributeError:
             parser.error("too few arguments")
 
-        args.func(lacrossegateway, config, args)
+        args.func(lacrossegateway, known, args)
 
     finally:
         if lacrossegateway is not None:
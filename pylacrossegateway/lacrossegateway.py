@@ -19,11 +19,23 @@
 from __future__ import unicode_literals
 import logging
 import re
+import select
+import selectors
 import threading
 import socket
 
 _LOGGER = logging.getLogger(__name__)
 
+_RE_INFO_FULL = re.compile(
+    r'\[(?P<name>\w+\.\w+).(?P<ver>.*) ' +
+    r'\(1=(?P<rfm1name>\w+) (\w+):(?P<rfm1freq>\d+) ' +
+    r'(?P<rfm1mode>.*)\) {IP=(?P<address>.*)}\]')
+
+_FREQUENCY_CMDS = {1: 'f', 2: 'F'}
+_DATARATE_CMDS = {1: 'r', 2: 'R'}
+_TOGGLE_INTERVAL_CMDS = {1: 't', 2: 'T'}
+_TOGGLE_MASK_CMDS = {1: 'm', 2: 'M'}
+
 """
     Jeelink lacrossegateway firmware commands
     <n>a     set to 0 if the blue LED bothers
@@ -42,25 +54,121 @@ _LOGGER = logging.getLogger(__name__)
        <n>y     if 1 all received packets will be retransmitted  (Relay mode)
 """
 
+class GatewayPoller(object):
+    """Receive data of several gateways on a single background thread.
+
+    The sockets of all scanning gateways are multiplexed with a selector
+    (epoll on Linux). The thread is started when the first gateway is
+    registered and exits once no gateway is left.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.RLock()
+        self._thread = None
+
+    def register(self, gateway):
+        """Start dispatching received data to the gateway."""
+        with self._lock:
+            self._selector.register(gateway._socket, selectors.EVENT_READ,
+                                    gateway)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=())
+                self._thread.daemon = True
+                self._thread.start()
+
+    def unregister(self, gateway):
+        """Stop dispatching received data to the gateway."""
+        with self._lock:
+            # look up by owner, the gateway may have replaced its socket
+            for key in list(self._selector.get_map().values()):
+                if key.data is gateway:
+                    self._selector.unregister(key.fileobj)
+
+    def _run(self):
+        """Background polling thread."""
+        try:
+            while True:
+                with self._lock:
+                    if not self._selector.get_map():
+                        self._thread = None
+                        return
+
+                for key, mask in self._selector.select(timeout=1.0):
+                    with self._lock:
+                        # skip gateways unregistered while we were selecting
+                        if self._selector.get_map().get(key.fd) is not key:
+                            continue
+                        try:
+                            key.data._process_input()
+                        except Exception:
+                            _LOGGER.exception('Error processing gateway input')
+        except Exception as e:
+            _LOGGER.exception('Gateway poller stopped')
+            # nothing reads these gateways anymore, wake up their waiters
+            with self._lock:
+                for key in list(self._selector.get_map().values()):
+                    key.data._stop_on_error('Receiving stopped: %s', e)
+        finally:
+            # let the next register() start a new thread
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+
+_POLLER = GatewayPoller()
+
+
 class LaCrosseGateway(object):
 
-    sensors = {}
-    _registry = {}
-    _callback = None
-    _socket = None
-    _stopevent = None
-    _thread = None
+    def __init__(self, host, port, poller=None):
+        """Initialize the LacrosseGateway device.
 
-    def __init__(self, host, port):
-        """Initialize the LacrosseGateway device."""
+        Gateways share a single receive thread unless another poller is
+        given.
+        """
         self._host = host
         self._port = port
+        self._poller = poller if poller is not None else _POLLER
+        self.sensors = {}
+        self._registry = {}
+        self._callback = None
         self._callback_data = None
+        self._socket = None
+        self._stopevent = None
+        self._rbuf = b''
 
     def open(self):
-        """Connect to the device."""
-        self._socket = socket.socket()
-        self._socket.connect((self._host, self._port))
+        """Connect to the device.
+
+        If a scan is running it continues on the new connection. If the
+        connection fails, the scan is stopped.
+        """
+        sock = socket.socket()
+        try:
+            sock.connect((self._host, self._port))
+        except socket.error as e:
+            sock.close()
+            if self._scanning():
+                self._stop_on_error('Reconnect failed: %s', e)
+            raise
+        # commands are tiny, don't let Nagle delay them
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        scanning = self._scanning()
+        if scanning:
+            self._poller.unregister(self)
+        old_socket, self._socket = self._socket, sock
+        self._rbuf = b''
+        if old_socket is not None:
+            old_socket.close()
+        if scanning:
+            self._socket.setblocking(False)
+            self._poller.register(self)
+
+    def _scanning(self):
+        return self._stopevent is not None and not self._stopevent.is_set()
 
     def close(self):
         """Close the device."""
@@ -68,12 +176,78 @@ class LaCrosseGateway(object):
         self._socket.close()
 
     def start_scan(self):
-        """Start scan task in background."""
+        """Start scan task in background.
+
+        While scanning the socket is non-blocking. Commands still wait
+        until they are written but raise TimeoutError if the gateway
+        does not accept them within a few seconds.
+        """
         self._start_worker()
 
+    def wait(self, timeout=None):
+        """Block until the background worker has stopped.
+
+        Returns True if the worker stopped, False on timeout.
+        """
+        if self._stopevent is None:
+            return True
+        return self._stopevent.wait(timeout)
+
+    def _pop_line(self):
+        """Return the next buffered line or None if there is none yet."""
+        idx = self._rbuf.find(b'\n')
+        if idx < 0:
+            return None
+        line = self._rbuf[:idx + 1]
+        self._rbuf = self._rbuf[idx + 1:]
+        return line
+
+    def _readline(self):
+        """Read one line from the socket.
+
+        Received data is buffered, so lines split across or coalesced into
+        a single recv are handled. Returns an empty bytes object once the
+        connection is closed.
+        """
+        while True:
+            line = self._pop_line()
+            if line is not None:
+                return line
+            data = self._socket.recv(4096)
+            if not data:
+                line, self._rbuf = self._rbuf, b''
+                return line
+            self._rbuf += data
+
+    def _sendall(self, data, timeout=5.0):
+        """Write all data to the socket.
+
+        Works on the non-blocking socket used while scanning, the socket
+        mode is left untouched since the poller thread owns it.
+        """
+        if not self._scanning():
+            self._socket.sendall(data)
+            return
+
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[self._socket.send(view):]
+                continue
+            except BlockingIOError:
+                pass
+            _, writable, _ = select.select([], [self._socket], [], timeout)
+            if not writable:
+                raise TimeoutError('timed out writing to gateway')
+
     def _write_cmd(self, cmd):
         """Write to socket."""
-        self._socket.sendall((cmd + '\r\n').encode())
+        self._sendall((cmd + '\r\n').encode())
+
+    def write_cmds(self, cmds):
+        """Write several commands to the socket at once."""
+        if cmds:
+            self._sendall(('\r\n'.join(cmds) + '\r\n').encode())
 
     @staticmethod
     def _parse_info(line):
@@ -83,11 +257,6 @@ class LaCrosseGateway(object):
         - [LaCrosseITPlusReader.10.1s (RFM12B f:0 t:10~3)]
         - [LaCrosseITPlusReader.Gateway.1.35 (1=RFM69 f:868300 r:8) {IP=192.168.178.40}]
         """
-        re_info = re.compile(
-            r'\[(?P<name>\w+\.\w+).(?P<ver>.*) ' +
-            r'\(1=(?P<rfm1name>\w+) (\w+):(?P<rfm1freq>\d+) ' +
-            r'(?P<rfm1mode>.*)\) {IP=(?P<address>.*)}\]')
-
         info = {
             'name': None,
             'version': None,
@@ -98,7 +267,7 @@ class LaCrosseGateway(object):
             'rfm1toggleinterval': None,
             'rfm1togglemask': None,
         }
-        match = re_info.match(line)
+        match = _RE_INFO_FULL.match(line)
         if match:
             info['name'] = match.group('name')
             info['version'] = match.group('ver')
@@ -115,23 +284,38 @@ class LaCrosseGateway(object):
 
         return info
 
-    def get_info(self):
-        """Get current configuration info from 'v' command."""
-        re_info = re.compile(r'\[.*\]')
+    def get_info(self, timeout=2.0, max_lines=10):
+        """Get current configuration info from 'v' command.
 
-        while True:
+        Raises TimeoutError if no answer arrives within max_lines lines
+        or timeout seconds per line.
+        Raises ConnectionError if the gateway closes the connection.
+        Raises RuntimeError while a scan is running, because the poller
+        thread owns the socket then.
+        """
+        if self._scanning():
+            raise RuntimeError('get_info() cannot be used while scanning')
+
+        prev_timeout = self._socket.gettimeout()
+        self._socket.settimeout(timeout)
+        try:
             self._write_cmd('v')
 
-            for x in range(10):
-                line = self._socket.recv(1024)            
+            for x in range(max_lines):
                 try:
-                    line = line.encode().decode('utf-8').strip('\r\n')
-                except AttributeError:
-                    line = line.decode('utf-8').strip('\r\n')
-
-                match = re_info.match(line)
-                if match:
+                    line = self._readline()
+                except socket.timeout:
+                    break
+                if not line:
+                    raise ConnectionError('connection closed by gateway')
+                line = line.decode('utf-8', 'replace').rstrip('\r\n')
+
+                if line.startswith('[') and ']' in line:
                     return self._parse_info(line)
+        finally:
+            self._socket.settimeout(prev_timeout)
+
+        raise TimeoutError("gateway did not respond to 'v' command")
 
     def led_mode_state(self, state):
         """Set the LED mode.
@@ -145,18 +329,30 @@ class LaCrosseGateway(object):
 
         The frequency can be set in 5kHz steps.
         """
-        cmds = {1: 'f', 2: 'F'}
-        self._write_cmd('{}{}'.format(frequency, cmds[rfm]))
+        self._write_cmd(self.frequency_cmd(frequency, rfm))
+
+    @staticmethod
+    def frequency_cmd(frequency, rfm=1):
+        """Return the set_frequency() command, for use with write_cmds()."""
+        return '{}{}'.format(frequency, _FREQUENCY_CMDS[rfm])
 
     def set_datarate(self, rate, rfm=1):
         """Set datarate (baudrate)."""
-        cmds = {1: 'r', 2: 'R'}
-        self._write_cmd('{}{}'.format(rate, cmds[rfm]))
+        self._write_cmd(self.datarate_cmd(rate, rfm))
+
+    @staticmethod
+    def datarate_cmd(rate, rfm=1):
+        """Return the set_datarate() command, for use with write_cmds()."""
+        return '{}{}'.format(rate, _DATARATE_CMDS[rfm])
 
     def set_toggle_interval(self, interval, rfm=1):
         """Set the toggle interval."""
-        cmds = {1: 't', 2: 'T'}
-        self._write_cmd('{}{}'.format(interval, cmds[rfm]))
+        self._write_cmd(self.toggle_interval_cmd(interval, rfm))
+
+    @staticmethod
+    def toggle_interval_cmd(interval, rfm=1):
+        """Return the set_toggle_interval() command, for use with write_cmds()."""
+        return '{}{}'.format(interval, _TOGGLE_INTERVAL_CMDS[rfm])
 
     def set_toggle_mask(self, mode_mask, rfm=1):
         """Set toggle baudrate mask.
@@ -167,50 +363,78 @@ class LaCrosseGateway(object):
           4 : 8.842 kbps
         These values can be or'ed.
         """
-        cmds = {1: 'm', 2: 'M'}
-        self._write_cmd('{}{}'.format(mode_mask, cmds[rfm]))
+        self._write_cmd(self.toggle_mask_cmd(mode_mask, rfm))
+
+    @staticmethod
+    def toggle_mask_cmd(mode_mask, rfm=1):
+        """Return the set_toggle_mask() command, for use with write_cmds()."""
+        return '{}{}'.format(mode_mask, _TOGGLE_MASK_CMDS[rfm])
 
     def _start_worker(self):
-        if self._thread is not None:
+        if self._scanning():
             return
+        self._socket.setblocking(False)
         self._stopevent = threading.Event()
-        self._thread = threading.Thread(target=self._refresh, args=())
-        self._thread.daemon = True
-        self._thread.start()
+        self._poller.register(self)
 
     def _stop_worker(self):
         if self._stopevent is not None:
+            self._poller.unregister(self)
             self._stopevent.set()
-        if self._thread is not None:
-            self._thread.join()
 
-    def _refresh(self):
-        """Background refreshing thread."""
+    def _stop_on_error(self, msg, *args):
+        _LOGGER.error(msg, *args)
+        self._poller.unregister(self)
+        self._stopevent.set()
 
-        while not self._stopevent.isSet():
-            line = self._socket.recv(1024)
-            #this is for python2/python3 compatibility. Is there a better way?
-            try:
-                line = line.encode().decode('utf-8').strip('\r\n')
-            except AttributeError:
-                line = line.decode('utf-8').strip('\r\n')
+    def _process_input(self):
+        """Handle newly received data, called from the poller thread."""
+        try:
+            data = self._socket.recv(4096)
+        except (BlockingIOError, socket.timeout):
+            return
+        except socket.error as e:
+            self._stop_on_error('Connection error: %s', e)
+            return
+
+        if not data:
+            self._stop_on_error('Connection closed by gateway')
+            return
 
-            if LaCrosseSensor.re_reading.match(line):
-                sensor = LaCrosseGatewaySensor(line)
-                self.sensors[sensor.sensorid] = sensor
+        self._rbuf += data
+
+        pop_line = self._pop_line
+        parse_fields = LaCrosseGatewaySensor._parse_fields
+        sensors = self.sensors
+        registry = self._registry
+        callback = self._callback
+
+        while True:
+            line = pop_line()
+            if line is None:
+                break
 
-                if self._callback:
-                    self._callback(sensor, self._callback_data)
+            fields = parse_fields(line.decode('utf-8', 'replace').rstrip('\r\n'))
+            if fields is None:
+                continue
 
-                if sensor.sensorid in self._registry:
-                    for cbs in self._registry[sensor.sensorid]:
-                        cbs[0](sensor, cbs[1])
+            sensorid = fields[1]
+            sensor = sensors.get(sensorid)
+            if sensor is None:
+                sensor = LaCrosseGatewaySensor()
+                sensors[sensorid] = sensor
+            sensor._set_fields(fields)
+
+            if callback:
+                callback(sensor, self._callback_data)
+
+            for cb in registry.get(sensorid, ()):
+                cb(sensor)
 
     def register_callback(self, sensorid, callback, user_data=None):
         """Register a callback for the specified sensor id."""
-        if sensorid not in self._registry:
-            self._registry[sensorid] = list()
-        self._registry[sensorid].append((callback, user_data))
+        self._registry.setdefault(sensorid, []).append(
+            lambda sensor: callback(sensor, user_data))
 
     def register_all(self, callback, user_data=None):
         """Register a callback for all sensors."""
@@ -222,24 +446,46 @@ class LaCrosseGatewaySensor(object):
     """The LaCrosse Sensor class."""
     # OK 9 248 1 4 150 106
     # OK 22 121 49 3 222 240 0 1 82 87 121 0 4 148 225 0 0 38 229 1 0 [79 31 F0 00 00 00 57 79 00 00 00 00 6D A7 08 00 00 26 E5 00 08 40 09 A9 00 9D 40 0C 7D 3D E0 00 00 00 04 15 20 10 02 EF 17]
-    re_reading = re.compile(r'OK (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+)')
+    READING_FIELDS = 21
+
+    __slots__ = ('sensortype', 'sensorid', 'ontime', 'totaltime', 'energy',
+                 'power', 'maxpower', 'resets')
 
     def __init__(self, line=None):
         if line:
-            self._parse(line)
-
-    def _parse(self, line):
-        match = self.re_reading.match(line)
-        if match:
-            data = [int(c) for c in match.group().split()[1:]]
-            self.sensortype = data[0]
-            self.sensorid = ''.join(f'{i:02X}' for i in [data[1], data[2]]) # str([f'{i:02x}' for i in [data[1], data[2]]])
-            self.ontime = (data[3] * 16777216) + (data[4] * 65536) + (data[5] * 256) + data[6]
-            self.totaltime = (data[7] * 16777216) + (data[8] * 65536) + (data[9] * 256) + data[10]
-            self.energy = (data[11] * 16777216) + (data[12] * 65536) + (data[13] * 256) + data[14]
-            self.power = (data[15] * 256) + data[16]
-            self.maxpower = (data[17] * 256) + data[18]
-            self.resets = data[19]
+            self.update(line)
+
+    def update(self, line):
+        """Update the sensor values in place from a reading line."""
+        fields = self._parse_fields(line)
+        if fields is not None:
+            self._set_fields(fields)
+
+    @classmethod
+    def _parse_fields(cls, line):
+        if not line.startswith('OK '):
+            return None
+        parts = line.split(None, cls.READING_FIELDS + 1)
+        if len(parts) <= cls.READING_FIELDS:
+            return None
+        try:
+            data = bytes(map(int, parts[1:cls.READING_FIELDS + 1]))
+        except ValueError:
+            return None
+        return (
+            data[0],
+            data[1:3].hex().upper(),
+            int.from_bytes(data[3:7], 'big'),
+            int.from_bytes(data[7:11], 'big'),
+            int.from_bytes(data[11:15], 'big'),
+            (data[15] << 8) | data[16],
+            (data[17] << 8) | data[18],
+            data[19],
+        )
+
+    def _set_fields(self, fields):
+        (self.sensortype, self.sensorid, self.ontime, self.totaltime,
+         self.energy, self.power, self.maxpower, self.resets) = fields
 
     def __repr__(self):
         return "id=%s pw=%d" % \
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+
+import argparse
+import errno
+import re
+import socket
+import threading
+import time
+
+import pytest
+
+from pylacrossegateway import (GatewayPoller, LaCrosseGateway,
+                               LaCrosseGatewaySensor)
+from pylacrossegateway.cli_tool import configure
+
+READING = b'OK 22 121 49 3 222 240 0 1 82 87 121 0 4 148 225 0 0 38 229 1 0\r\n'
+
+
+def make_gateway(poller=None):
+    """Return a gateway connected to the returned peer socket."""
+    if poller is None:
+        poller = GatewayPoller()
+    sock, peer = socket.socketpair()
+    gateway = LaCrosseGateway(None, None, poller=poller)
+    gateway._socket = sock
+    return gateway, peer
+
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestGatewayPoller(object):
+
+    def test_receive_callback(self):
+        gateway, peer = make_gateway()
+        received = threading.Event()
+        calls = []
+
+        def callback(sensor, user_data):
+            calls.append((sensor.sensorid, user_data))
+            received.set()
+
+        gateway.register_all(callback, user_data='all')
+        gateway.register_callback('7931', lambda s, d: calls.append(d), 'id')
+        gateway.start_scan()
+        peer.sendall(READING)
+
+        assert received.wait(3)
+        assert wait_for(lambda: len(calls) == 2)
+        assert calls == [('7931', 'all'), 'id']
+        assert gateway.sensors['7931'].maxpower == 9957
+
+        gateway.close()
+        peer.close()
+
+    def test_close_unregisters(self):
+        poller = GatewayPoller()
+        gateway, peer = make_gateway(poller)
+        gateway.start_scan()
+        assert len(poller._selector.get_map()) == 1
+
+        gateway.close()
+        assert len(poller._selector.get_map()) == 0
+        assert gateway.wait(0)
+        peer.close()
+
+    def test_eof_sets_stop_event(self):
+        poller = GatewayPoller()
+        gateway, peer = make_gateway(poller)
+        gateway.start_scan()
+        assert not gateway.wait(0)
+
+        peer.close()
+        assert gateway.wait(3)
+        assert len(poller._selector.get_map()) == 0
+        gateway.close()
+
+    def test_thread_exits_with_last_gateway(self):
+        poller = GatewayPoller()
+        gateway1, peer1 = make_gateway(poller)
+        gateway2, peer2 = make_gateway(poller)
+        gateway1.start_scan()
+        gateway2.start_scan()
+        thread = poller._thread
+        assert thread.is_alive()
+
+        gateway1.close()
+        time.sleep(0.1)
+        assert thread.is_alive()
+
+        gateway2.close()
+        thread.join(3)
+        assert not thread.is_alive()
+        assert poller._thread is None
+
+        peer1.close()
+        peer2.close()
+
+    def test_reopen_while_scanning(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(2)
+        poller = GatewayPoller()
+        gateway = LaCrosseGateway('127.0.0.1', server.getsockname()[1],
+                                  poller=poller)
+
+        gateway.open()
+        peer1, _ = server.accept()
+        gateway.start_scan()
+        gateway.open()
+        peer2, _ = server.accept()
+
+        peer2.sendall(READING)
+        assert wait_for(lambda: '7931' in gateway.sensors)
+
+        # the replaced connection is closed
+        assert peer1.recv(16) == b''
+
+        gateway.close()
+        assert len(poller._selector.get_map()) == 0
+        poller_thread = poller._thread
+        if poller_thread is not None:
+            poller_thread.join(3)
+        assert poller._thread is None
+
+        for s in (peer1, peer2, server):
+            s.close()
+
+    def test_failed_reopen_stops_scan(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        poller = GatewayPoller()
+        gateway = LaCrosseGateway('127.0.0.1', server.getsockname()[1],
+                                  poller=poller)
+
+        gateway.open()
+        peer, _ = server.accept()
+        gateway.start_scan()
+        server.close()
+
+        with pytest.raises(ConnectionRefusedError):
+            gateway.open()
+        assert gateway.wait(0)
+        assert len(poller._selector.get_map()) == 0
+
+        gateway.close()
+        peer.close()
+
+    def test_select_error_stops_gateways(self):
+        poller = GatewayPoller()
+        gateway, peer = make_gateway(poller)
+
+        def select(timeout=None):
+            raise OSError(errno.EBADF, 'Bad file descriptor')
+
+        poller._selector.select = select
+        gateway.start_scan()
+
+        assert gateway.wait(3)
+        assert len(poller._selector.get_map()) == 0
+        assert wait_for(lambda: poller._thread is None)
+        gateway.close()
+        peer.close()
+
+    def test_get_info_refused_while_scanning(self):
+        gateway, peer = make_gateway()
+        gateway.start_scan()
+        with pytest.raises(RuntimeError):
+            gateway.get_info()
+        gateway.close()
+        peer.close()
+
+
+class TestReadline(object):
+
+    def test_line_split_across_recvs(self):
+        gateway, peer = make_gateway()
+        peer.sendall(b'OK 22 121')
+        peer.sendall(b' 49\r\n')
+        assert gateway._readline() == b'OK 22 121 49\r\n'
+        gateway._socket.close()
+        peer.close()
+
+    def test_lines_coalesced_in_one_recv(self):
+        gateway, peer = make_gateway()
+        peer.sendall(b'OK 1\r\nOK 2\r\nOK 3')
+        peer.close()
+        assert gateway._readline() == b'OK 1\r\n'
+        assert gateway._readline() == b'OK 2\r\n'
+        assert gateway._readline() == b'OK 3'
+        assert gateway._readline() == b''
+        gateway._socket.close()
+
+
+class TestGetInfo(object):
+
+    def test_info(self):
+        gateway, peer = make_gateway()
+        peer.sendall(b'OK 9 1\r\n[LaCrosseITPlusReader.Gateway.1.35 '
+                     b'(1=RFM69 f:868300 r:8) {IP=192.168.178.40}]\r\n')
+        info = gateway.get_info()
+        assert peer.recv(16) == b'v\r\n'
+        assert info['name'] == 'LaCrosseITPlusReader.Gateway'
+        assert info['rfm1datarate'] == '8'
+        gateway._socket.close()
+        peer.close()
+
+    def test_timeout(self):
+        gateway, peer = make_gateway()
+        with pytest.raises(TimeoutError):
+            gateway.get_info(timeout=0.05)
+        gateway._socket.close()
+        peer.close()
+
+    def test_connection_closed(self):
+        gateway, peer = make_gateway()
+        peer.shutdown(socket.SHUT_WR)
+        with pytest.raises(ConnectionError):
+            gateway.get_info()
+        gateway._socket.close()
+        peer.close()
+
+
+class TestCommands(object):
+
+    def test_set_commands(self):
+        gateway, peer = make_gateway()
+        gateway.set_frequency(868300)
+        gateway.set_frequency(868300, rfm=2)
+        gateway.set_datarate(8, rfm=2)
+        gateway.set_toggle_interval(10)
+        gateway.set_toggle_mask(3, rfm=2)
+        gateway.led_mode_state(False)
+        gateway._socket.close()
+        assert peer.recv(1024) == (b'868300f\r\n868300F\r\n8R\r\n'
+                                   b'10t\r\n3M\r\n0a\r\n')
+        peer.close()
+
+    def test_invalid_rfm(self):
+        with pytest.raises(KeyError):
+            LaCrosseGateway.frequency_cmd(868300, rfm=3)
+
+    def test_write_while_scanning(self):
+        gateway, peer = make_gateway()
+        gateway._socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        gateway.start_scan()
+        cmds = [gateway.frequency_cmd(868300, 1)] * 20000
+        expected = ('\r\n'.join(cmds) + '\r\n').encode()
+
+        peer.settimeout(3)
+        writer = threading.Thread(target=gateway.write_cmds, args=(cmds,))
+        writer.start()
+        received = b''
+        while len(received) < len(expected):
+            data = peer.recv(65536)
+            assert data
+            received += data
+        writer.join(3)
+        assert received == expected
+
+        gateway.close()
+        peer.close()
+
+    def test_write_cmds(self):
+        gateway, peer = make_gateway()
+        gateway.write_cmds([gateway.datarate_cmd(8, 1),
+                            gateway.toggle_mask_cmd(1, 2)])
+        gateway.write_cmds([])
+        gateway._socket.close()
+        assert peer.recv(1024) == b'8r\r\n1M\r\n'
+        peer.close()
+
+
+class TestCliConfigure(object):
+
+    def test_rfm2_options(self):
+        gateway, peer = make_gateway()
+        args = argparse.Namespace(
+            frequency_rfm1='868300', frequency_rfm2='868250',
+            datarate_rfm1='17241', datarate_rfm2='9579',
+            toggle_mask_rfm1='1', toggle_mask_rfm2='2',
+            toggle_interval_rfm1='10', toggle_interval_rfm2='20')
+        configure(gateway, {}, args)
+        gateway._socket.close()
+        assert peer.recv(1024) == (b'868300f\r\n868250F\r\n'
+                                   b'17241r\r\n9579R\r\n'
+                                   b'1m\r\n2M\r\n'
+                                   b'10t\r\n20T\r\n')
+        peer.close()
+
+    def test_no_options(self):
+        gateway, peer = make_gateway()
+        args = argparse.Namespace(
+            frequency_rfm1=None, frequency_rfm2=None,
+            datarate_rfm1=None, datarate_rfm2=None,
+            toggle_mask_rfm1=None, toggle_mask_rfm2=None,
+            toggle_interval_rfm1=None, toggle_interval_rfm2=None)
+        configure(gateway, {}, args)
+        gateway._socket.close()
+        assert peer.recv(1024) == b''
+        peer.close()
+
+
+# the regex based parser the split based one replaced
+RE_READING = re.compile(r'OK' + r' (\d+)' * 21)
+
+
+def parse_reference(line):
+    match = RE_READING.match(line)
+    if not match:
+        return None
+    data = [int(c) for c in match.group().split()[1:]]
+    return (
+        data[0],
+        ''.join('%02X' % i for i in [data[1], data[2]]),
+        (data[3] * 16777216) + (data[4] * 65536) + (data[5] * 256) + data[6],
+        (data[7] * 16777216) + (data[8] * 65536) + (data[9] * 256) + data[10],
+        (data[11] * 16777216) + (data[12] * 65536) + (data[13] * 256) + data[14],
+        (data[15] * 256) + data[16],
+        (data[17] * 256) + data[18],
+        data[19],
+    )
+
+
+class TestLaCrosseGatewaySensor(object):
+
+    def test_init(self):
+        s = LaCrosseGatewaySensor(READING.decode().rstrip('\r\n'))
+        assert s.sensortype == 22
+        assert s.sensorid == '7931'
+        assert s.ontime == 64942080
+        assert s.totaltime == 22173561
+        assert s.energy == 300257
+        assert s.power == 0
+        assert s.maxpower == 9957
+        assert s.resets == 1
+
+    def test_parse_matches_regex_parser(self):
+        lines = [
+            READING.decode().rstrip('\r\n'),
+            'OK 22 10 255 3 222 240 0 1 82 87 121 0 4 148 225 0 0 38 229 1 0',
+            'OK 22 121 49 3 222 240 0 1 82 87 121 0 4 148 225 0 0 38 229 1 0 '
+            '[79 31 F0 00 00 00 57 79 00 00 00 00 6D A7 08 00 00 26 E5 00]',
+            'OK 9 248 1 4 150 106',
+            'OK 22 121 49 3 222 240 0 1 82 87 121 0 4 148 225 0 0 38 229 1 x',
+            'NOK 22 121 49 3 222 240 0 1 82 87 121 0 4 148 225 0 0 38 229 1 0',
+            '[LaCrosseITPlusReader.Gateway.1.35 (1=RFM69 f:868300 r:8)]',
+            '',
+        ]
+        for line in lines:
+            assert LaCrosseGatewaySensor._parse_fields(line) == \
+                parse_reference(line), line
+
+    def test_update_in_place(self):
+        s = LaCrosseGatewaySensor(READING.decode())
+        s.update('OK 22 121 49 3 222 240 0 1 82 87 121 0 4 148 225 0 7 38 229 1 0')
+        assert s.power == 7
+        assert s.sensorid == '7931'